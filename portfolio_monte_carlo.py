@@ -1,8 +1,27 @@
 import yfinance as yf
 import matplotlib.pyplot as plt
-import random
-import statistics as sta
+from matplotlib.collections import LineCollection
 import numpy as np
+import functools
+import os
+import time
+import zipfile
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError: # numba is optional, the NumPy simulation is used without it
+    NUMBA_AVAILABLE = False
+
+try:
+    import cupy as cp
+    # cupy imports without a CUDA driver or device, so check for one too
+    try:
+        CUPY_AVAILABLE = cp.cuda.runtime.getDeviceCount() > 0
+    except cp.cuda.runtime.CUDARuntimeError:
+        CUPY_AVAILABLE = False
+except ImportError: # cupy is optional, the simulation runs on the CPU without it
+    CUPY_AVAILABLE = False
 
 
 # --- MONTE CARLO PORTFOLIO SIMULATOR --- #
@@ -28,6 +47,7 @@ import numpy as np
 #    trials to run, which portfolio to use, and what the initial invested amount
 #    is. The simulation of the portfolio for the specified period of years is 
 #    repeated for many trials to record a vast amount of possible outcomes.
+#    Optionally, set SEED to an integer to get the same results on every run.
 # 4) (Optional) Select the historical annualized return of a benchmark 
 #    (the default is 11.88% of the SP500). The program will calculate how often
 #    the portfolio's simulations outperform the benchmark's expected future 
@@ -75,6 +95,7 @@ TRIALS = 1000
 YEARS_TO_SIMULATE = 10
 PORTFOLIO = portfolio2
 INITIAL_INVESTMENT = 100
+SEED = None # Set to an integer >= 0 to make the simulation reproducible
 
 
 # 4) BENCHMARK RETURN (USER INPUT HERE >>>)
@@ -83,17 +104,71 @@ benchmark_future_value = INITIAL_INVESTMENT * (1 + BENCHMARK_ANNUAL_RETURN) \
     ** YEARS_TO_SIMULATE  # Value of the benchmark at the end of the simulation period
 
 
+# DATA CACHE #
+# Yearly returns downloaded from Yahoo Finance are saved to disk and reused for
+# CACHE_MAX_AGE seconds, so that only the first run of the day downloads them.
+# The cache lives next to this script, wherever it is run from
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+CACHE_MAX_AGE = 24 * 60 * 60
+
+
 # FUNCTIONS #
-def get_yearly_returns(asset: object) -> list:
-    """ Return a list with all recorded yearly returns of an asset.
+def get_yearly_returns(asset: object) -> np.ndarray:
+    """ Return an array with all recorded yearly returns of an asset.
     
     >>> get_yearly_returns(btc)
-    [0.3447108315183143, 1.2383113710651474, 13.688978981270699, ...]
+    array([ 0.34471083,  1.23831137, 13.68897898, ...])
+    """
+    
+    return _load_yearly_returns(asset.ticker, _NotCacheKey(asset))
+
+class _NotCacheKey:
+    """ Wrapper passing a value through functools.lru_cache without making it
+    part of the cache key: all instances hash and compare equal.
+    """
+    
+    def __init__(self, value):
+        self.value = value
+    
+    def __hash__(self):
+        return 0
+    
+    def __eq__(self, other):
+        return isinstance(other, _NotCacheKey)
+
+@functools.lru_cache(maxsize=None)
+def _load_yearly_returns(ticker: str, asset: _NotCacheKey) -> np.ndarray:
+    """ Return the yearly returns of asset.value, whose Yahoo ticker is ticker,
+    reading them from CACHE_DIR if they were saved less than CACHE_MAX_AGE
+    seconds ago, and downloading (then saving) them otherwise. Results are
+    cached in memory by ticker only.
     """
     
-    data = asset.history('max').Close.resample('Y').ffill().pct_change()
-    data = [value for value in data]
-    data.pop(0) # Remove the first value which is nan
+    cache_path = os.path.join(CACHE_DIR, f'{ticker}.npz')
+    if os.path.exists(cache_path) \
+            and time.time() - os.path.getmtime(cache_path) < CACHE_MAX_AGE:
+        try:
+            with np.load(cache_path) as cached:
+                return cached['returns']
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            pass # Unreadable cache file, download the data again
+    
+    history = asset.value.history('max')
+    close = history['Close'].to_numpy()
+    year = history.index.year.to_numpy()
+    
+    # Closing price on the last recorded day of every calendar year
+    year_end = year != np.roll(year, -1)
+    year_end[-1] = True
+    c = close[year_end]
+    data = (c[1:] - c[:-1]) / c[:-1]
+    
+    # Write to a temporary file first, so that an interrupted run never leaves
+    # a truncated cache file behind
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = os.path.join(CACHE_DIR, f'{ticker}.tmp.npz')
+    np.savez(tmp_path, returns=data)
+    os.replace(tmp_path, cache_path)
     
     return data
 
@@ -121,75 +196,185 @@ def growth_probability(growth_data, min_growth_pct: float, max_growth_pct: float
     94.8
     """
     
-    count = 0
-    
-    if min_growth_pct == None and max_growth_pct != None:
-        for growth in growth_data:
-            if growth < max_growth_pct:
-                count += 1
-         
-    elif min_growth_pct != None and max_growth_pct == None:
-        for growth in growth_data:
-            if growth > min_growth_pct:
-                count += 1
+    growth_data = np.asarray(growth_data)
+    
+    if min_growth_pct is None and max_growth_pct is not None:
+        in_range = growth_data < max_growth_pct
+    elif min_growth_pct is not None and max_growth_pct is None:
+        in_range = growth_data > min_growth_pct
     else:
-        for growth in growth_data:
-            if min_growth_pct < growth < max_growth_pct:
-                count += 1
+        in_range = (growth_data > min_growth_pct) & (growth_data < max_growth_pct)
     
-    return count / len(growth_data) * 100
+    return float(in_range.mean() * 100)
+
+if NUMBA_AVAILABLE:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def run_sim(returns_flat, offsets, weights, years, trials, init, seed, block):
+        """ Return a (trials, years + 1) array of simulated portfolio values.
+        
+        The historical returns of asset a are 
+        returns_flat[offsets[a]:offsets[a + 1]]. Trials run in parallel, in
+        blocks of block trials. If seed >= 0, block b is drawn from numba's RNG
+        seeded with (seed + b) % 2**32 (numba seeds are 32-bit), so results do
+        not depend on how blocks are split between threads. Without a seed,
+        block should be 1.
+        """
+        
+        out = np.empty((trials, years + 1), dtype=np.float32)
+        for b in prange((trials + block - 1) // block):
+            if seed >= 0:
+                np.random.seed((seed + b) % 4294967296)
+            for t in range(b * block, min((b + 1) * block, trials)):
+                v = init
+                out[t, 0] = v
+                for y in range(years):
+                    g = 0.0
+                    for a in range(weights.size):
+                        lo, hi = offsets[a], offsets[a + 1]
+                        r = returns_flat[np.random.randint(lo, hi)]
+                        g += weights[a] * r
+                    v *= (1.0 + g) # Portfolio is rebalanced every year
+                    out[t, y + 1] = v
+        
+        return out
 
 
 # MONTE CARLO SIMULATION #
-# Store assets data for each asset in portfolio (saves computation time)
-yearly_returns = {}
-for asset in PORTFOLIO.keys():
-    yearly_returns[asset.ticker] = get_yearly_returns(asset)
+# Store assets data for each asset in portfolio (saves computation time).
+# Assets are referred to by their index in assets from here on, so that no
+# dict lookup or attribute access is left inside the simulation.
+# Simulation arrays are float32: Monte Carlo sampling noise (~1/sqrt(TRIALS))
+# is far larger than float32 rounding, and half the bytes move twice as fast
+assets = list(PORTFOLIO.keys())
+weights = np.array([PORTFOLIO[asset] for asset in assets], dtype=np.float32)
+returns_list = [np.asarray(get_yearly_returns(asset)) for asset in assets]
+A = len(assets)
 
-data = []
+# Random draws come from two generators, both seeded with SEED: _rng for the
+# NumPy simulation and the plotted-path sample, and numba's own per-thread
+# MT19937 inside run_sim when numba runs the simulation (the CuPy path seeds
+# its own device generator). numba only takes 32-bit seeds, so it uses SEED
+# modulo 2**32
+if SEED is not None and (not isinstance(SEED, int) or SEED < 0):
+    raise ValueError('SEED must be None or an integer >= 0')
+_rng = np.random.default_rng(SEED)
 
-for _ in range(TRIALS):
-    current_sim_data = []
-    portfolio_value = 0
+# Large simulations run on the GPU when cupy and a CUDA device are available.
+# xp is the array module (numpy or cupy) used by the array simulation below
+GPU_MIN_TRIALS = 10 ** 5
+xp = cp if CUPY_AVAILABLE and TRIALS >= GPU_MIN_TRIALS else np
+
+if NUMBA_AVAILABLE and xp is np:
+    # Pack all historical returns in one flat array, asset a's returns being
+    # returns_flat[offsets[a]:offsets[a + 1]]
+    returns_flat = np.concatenate(returns_list).astype(np.float32)
+    offsets = np.zeros(A + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(returns) for returns in returns_list])
+    
+    # Without a SEED every trial is its own parallel work item. With a SEED,
+    # trials are grouped in small blocks of NUMBA_BLOCK and the RNG is
+    # reseeded once per block: reseeding costs about as much as a few trials'
+    # draws, and there are still plenty of blocks to spread across threads
+    NUMBA_BLOCK = 1 if SEED is None else 32
+    data = run_sim(returns_flat, offsets, weights, YEARS_TO_SIMULATE, TRIALS,
+                   float(INITIAL_INVESTMENT), -1 if SEED is None else SEED % 2 ** 32,
+                   NUMBA_BLOCK)
+else:
+    # Matrix of historical returns R[a, h], one contiguous row per asset,
+    # zero-padded to a common length (rounded up to a multiple of 8 floats).
+    # The padding is never sampled: the GPU gather only draws indices below
+    # each asset's length, and the CPU draws from the unpadded asset_rows
+    lengths = np.array([len(returns) for returns in returns_list])
+    H = -(-lengths.max() // 8) * 8
+    R = np.zeros((A, H), dtype=np.float32)
+    for a, returns in enumerate(returns_list):
+        R[a, :lengths[a]] = returns
+    asset_rows = [R[a, :lengths[a]] for a in range(A)] # Valid part of each row
+    R_xp, weights_xp = xp.asarray(R), xp.asarray(weights)
     
-    for year in range(YEARS_TO_SIMULATE + 1):
-        value_to_add = 0
+    # Portfolio value of every trial (rows) at the start of every year (columns)
+    data = xp.empty((TRIALS, YEARS_TO_SIMULATE + 1), dtype=xp.float32)
+    data[:, 0] = INITIAL_INVESTMENT
+    
+    # Trials are simulated in chunks of T_CHUNK, which caps peak memory
+    # regardless of TRIALS. A chunk is sized from the temporaries it allocates
+    # per simulated year: on the CPU, the float32 sample buffer (4 bytes per
+    # asset) plus one asset's int64 indices (8 bytes), kept to ~256 KB to stay
+    # in the L2 cache. On the GPU, int64 indices and float32 samples for every
+    # asset (12 bytes per asset), kept to ~192 MB to keep the device busy
+    rng = _rng if xp is np else cp.random.default_rng(SEED)
+    if xp is np:
+        CHUNK_BYTES = 256 * 1024
+        bytes_per_trial = YEARS_TO_SIMULATE * (4 * A + 8)
+    else:
+        CHUNK_BYTES = 192 * 2 ** 20
+        bytes_per_trial = YEARS_TO_SIMULATE * A * (8 + 4)
+    T_CHUNK = max(1, CHUNK_BYTES // bytes_per_trial)
+    if xp is np:
+        sample_buffer = np.empty((A, T_CHUNK * YEARS_TO_SIMULATE), dtype=np.float32)
+    for start in range(0, TRIALS, T_CHUNK):
+        end = min(start + T_CHUNK, TRIALS)
+        samples_per_asset = (end - start) * YEARS_TO_SIMULATE
         
-        for asset in PORTFOLIO:
-            weight = PORTFOLIO[asset]
-            
-            if year == 0:
-                portfolio_value += INITIAL_INVESTMENT * weight
-            else:
-                asset_value = portfolio_value * weight # Portfolio is rebalanced
-                random_return = random.choice(yearly_returns[asset.ticker])
-                value_to_add += asset_value * random_return
+        # Randomly pick a return for every (asset, trial, year), only from the
+        # valid part of each asset's history. On the CPU, np.take gathers each
+        # asset's returns straight into its row of the reused sample buffer
+        # (the same draw as rng.choice, without its result array and copy;
+        # mode='clip' keeps take from buffering out, the indices are in range
+        # anyway). cupy's Generator.integers only takes scalar bounds, so the
+        # GPU draws indices asset by asset, then gathers them all at once
+        if xp is np:
+            sampled = sample_buffer[:, :samples_per_asset]
+            for a in range(A):
+                idx = rng.integers(0, lengths[a], size=samples_per_asset)
+                np.take(asset_rows[a], idx, out=sampled[a], mode='clip')
+        else:
+            idx = xp.empty((A, samples_per_asset), dtype=xp.int64)
+            for a in range(A):
+                idx[a] = rng.integers(0, int(lengths[a]), size=samples_per_asset)
+            sampled = xp.take_along_axis(R_xp, idx, axis=1)
         
-        portfolio_value += value_to_add
-        current_sim_data.append(portfolio_value)
+        # Yearly growth factor of the portfolio (rebalanced every year)
+        growth = 1.0 + weights_xp @ sampled
+        growth = growth.reshape(end - start, YEARS_TO_SIMULATE)
+        
+        # Compounding is done in log space, turning the cumulative product into
+        # a cumulative sum (a growth of 0 gives log -inf, i.e. a value of 0)
+        with np.errstate(divide='ignore'):
+            log_growth = xp.log(growth)
+        data[start:end, 1:] = INITIAL_INVESTMENT * xp.exp(xp.cumsum(log_growth, axis=1))
     
-    data.append(current_sim_data)
-                
+    if xp is not np:
+        data = xp.asnumpy(data) # Results are copied back once, for plotting
+
 
 # VISUALIZE RESULTS # 
 fig, ax = plt.subplots(2) 
 
-# Plot all simulated portfolios over time
-for sim_data in data:
-    
-    # Convert yearly portfolio values to % increase from start of the simulation
-    sim_data = np.array(sim_data) 
-    sim_data = (sim_data - INITIAL_INVESTMENT) / INITIAL_INVESTMENT * 100
-    
-    ax[0].plot(sim_data)
-    
+# Convert yearly portfolio values to % increase from start of the simulation
+pct = (data - INITIAL_INVESTMENT) / INITIAL_INVESTMENT * 100
+
+# Plot a random sample of at most MAX_PLOTTED_TRIALS simulated portfolios over
+# time, as a single artist (more paths only overplot into a solid blob)
+MAX_PLOTTED_TRIALS = 500
+years = np.arange(YEARS_TO_SIMULATE + 1)
+plotted = _rng.choice(TRIALS, size=min(MAX_PLOTTED_TRIALS, TRIALS), replace=False)
+plotted_pct = pct[plotted]
+segs = np.stack([np.broadcast_to(years, plotted_pct.shape), plotted_pct], axis=-1) # (paths, years, 2)
+ax[0].add_collection(LineCollection(segs, linewidths=0.3, alpha=0.3))
+
+# Overlay the median and the 5th-95th percentile band of all trials
+p05, p50, p95 = np.percentile(pct, [5, 50, 95], axis=0)
+ax[0].fill_between(years, p05, p95, alpha=0.3, label='5th-95th percentile')
+ax[0].plot(years, p50, lw=2, label='Median')
+ax[0].legend()
+ax[0].autoscale()
 ax[0].set_xlabel('Years')
 ax[0].set_ylabel('Portfolio Value Increase (%)')
 
 # Plot distribution of final portfolio growths (x = growth %, y = frequency %)
-final_growths = [sim_data[-1] / INITIAL_INVESTMENT * 100 - 100 for sim_data in data]
-final_growth_counts = [final_growths.count(value) for value in final_growths]
-final_growth_frequencies = np.array(final_growth_counts) / TRIALS * 100
+final_growths = pct[:, -1]
+final_growth_frequencies = np.full(TRIALS, 100.0 / TRIALS) # Each trial is 1/TRIALS of outcomes
 
 ax[1].hist(final_growths, weights = final_growth_frequencies, bins = 100)
 ax[1].set_xlabel('Final Growth (%)')
@@ -197,9 +382,12 @@ ax[1].set_ylabel('Frequency (%)')
 
 # Print relevant statistics
 print('>>> Portfolio Growth Data: <<<')
-print(f'Mean: {round(sta.mean(final_growths), 2)}%')
-print(f'Median: {round(sta.median(final_growths), 2)}%')
-print(f'Range: {round(min(final_growths), 2)}% to {round(max(final_growths), 2)}%')
+mean_growth = final_growths.mean(dtype=np.float64) # Accumulate in 64-bit
+median_growth = np.median(final_growths)
+min_growth, max_growth = final_growths.min(), final_growths.max()
+print(f'Mean: {mean_growth:.2f}%\n'
+      f'Median: {median_growth:.2f}%\n'
+      f'Range: {min_growth:.2f}% to {max_growth:.2f}%')
 
 outperformance_probability = growth_probability(final_growths, benchmark_future_value, None)
 print(f'Probability of outperforming benchmark: {round(outperformance_probability, 2)}%')